@@ -0,0 +1,37 @@
+"""Ahead-of-time compile the numeric kernels in main.py into drone_kernels.
+
+Run ``python _build_kernels.py`` once after installing numba; main.py imports
+the resulting extension module when present and otherwise JIT-compiles the
+same kernels on first call.
+
+The build is stamped with main.KERNELS_VERSION; main.py ignores a build whose
+stamp does not match, so bump that constant and rebuild after editing an
+exported kernel. pycc does not apply the @njit options, so the AOT versions
+are compiled without fastmath and do not release the GIL.
+"""
+import os
+import sys
+
+from numba.pycc import CC
+
+# Load main.py's jitted kernels even if a previous build is importable
+sys.modules['drone_kernels'] = None
+import main
+
+cc = CC('drone_kernels')
+cc.output_dir = os.path.dirname(os.path.abspath(__file__))
+
+KERNELS_VERSION = main.KERNELS_VERSION
+
+
+def kernels_version():
+    return KERNELS_VERSION
+
+
+# _mark_cleaned is a parallel kernel, which pycc cannot compile; it stays JIT
+cc.export('zigzag', 'f4[:,:](f8[:,:], f8)')(main._zigzag.py_func)
+cc.export('interp_path', 'f8[:,:](f8[:], f8[:], i8)')(main._interp_path.py_func)
+cc.export('kernels_version', 'i8()')(kernels_version)
+
+if __name__ == "__main__":
+    cc.compile()
@@ -1,10 +1,80 @@
 import numpy as np
 import time
+from collections import OrderedDict
 from enum import Enum, auto
-from dataclasses import dataclass
-from typing import List, Tuple
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple, Union
 import math
-import random
+
+try:
+    from numba import njit, prange
+except ImportError:  # numba is optional - fall back to plain Python kernels
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
+    prange = range
+
+# The kernels take and return ndarrays only. fastmath lets LLVM reorder and
+# fuse the float ops, so results can differ from NumPy in the last ulp -
+# irrelevant at metre scale. nogil lets several drones plan on separate threads.
+@njit(cache=True, fastmath=True, boundscheck=False, nogil=True)
+def _zigzag(corners, spacing):
+    min_x, max_x = corners[:, 0].min(), corners[:, 0].max()
+    min_y, max_y = corners[:, 1].min(), corners[:, 1].max()
+    z = corners[0, 2]
+    n = int((max_y - min_y) // spacing) + 1
+    out = np.empty((2 * n, 3), dtype=np.float32)
+    for i in range(n):
+        y = min_y + i * spacing
+        out[2 * i, 0] = min_x
+        out[2 * i, 1] = y
+        out[2 * i, 2] = z
+        out[2 * i + 1, 0] = max_x
+        out[2 * i + 1, 1] = y
+        out[2 * i + 1, 2] = z
+    return out
+
+@njit(cache=True, parallel=True, fastmath=True, boundscheck=False, nogil=True)
+def _mark_cleaned(path, centers, out_mask):
+    # Threads only ever write True, so concurrent updates to a window agree
+    n, m = path.shape[0], centers.shape[0]
+    for i in prange(n):
+        for j in range(m):
+            dx = path[i, 0] - centers[j, 0]
+            dy = path[i, 1] - centers[j, 1]
+            dz = path[i, 2] - centers[j, 2]
+            if dx * dx + dy * dy + dz * dz < 1.0:
+                out_mask[j] = True
+
+@njit(cache=True, fastmath=True, boundscheck=False, nogil=True)
+def _interp_path(start, delta, steps):
+    out = np.empty((steps, 3))
+    for k in range(steps):
+        t = (k + 1) / steps
+        out[k, 0] = start[0] + delta[0] * t
+        out[k, 1] = start[1] + delta[1] * t
+        out[k, 2] = start[2] + delta[2] * t
+    return out
+
+# Bump whenever an AOT-exported kernel (_zigzag, _interp_path) changes, so
+# builds from _build_kernels.py made against older kernels are ignored
+KERNELS_VERSION = 3
+
+# Prefer the ahead-of-time build from _build_kernels.py to skip JIT warm-up
+try:
+    import drone_kernels
+except ImportError:
+    drone_kernels = None
+if drone_kernels is not None:
+    if getattr(drone_kernels, "kernels_version", lambda: None)() == KERNELS_VERSION:
+        _zigzag = drone_kernels.zigzag
+        _interp_path = drone_kernels.interp_path
+    else:
+        print("drone_kernels build is stale - rerun _build_kernels.py; using JIT kernels")
+
+# Number of planned paths kept for replanning over an already-seen window set
+PATH_CACHE_SIZE = 32
 
 class DroneState(Enum):
     IDLE = auto()
@@ -22,20 +92,39 @@ class Window:
     center: Tuple[float, float, float]
     size: Tuple[float, float]  # width, height
     cleaned: bool = False
+    _pattern: Optional[np.ndarray] = field(default=None, repr=False, compare=False)
+    _pattern_spacing: Optional[float] = field(default=None, repr=False, compare=False)
+
+    def pattern(self, spacing: float) -> np.ndarray:
+        # Corners never change after detection, so the zigzag is built once per spacing
+        if self._pattern is None or self._pattern_spacing != spacing:
+            corners_arr = np.array(self.corners, dtype=np.float64)
+            self._pattern = _zigzag(corners_arr, spacing)
+            self._pattern_spacing = spacing
+        return self._pattern
 
 class CleaningDrone:
-    def __init__(self):
+    def __init__(self, realtime: bool = True):
+        # With realtime=False every sleep is skipped; battery and fluid decay
+        # are tied to scan ticks and waypoints rather than wall-clock time.
+        self.realtime = realtime
         self.state = DroneState.IDLE
         self.position = (0.0, 0.0, 0.0)
         self.home_position = (0.0, 0.0, 0.0)
         self.battery = 100.0  # percentage
         self.cleaning_fluid = 100.0  # percentage
         self.windows: List[Window] = []
-        self.cleaning_path: List[Tuple[float, float, float]] = []
+        # Planning geometry is float32: centimetre precision is ample and it
+        # halves the bandwidth of the (N, 3) arrays the kernels sweep
+        self.cleaning_path: np.ndarray = np.empty((0, 3), dtype=np.float32)  # (N, 3) waypoints
         self.speed = 1.0  # m/s
         self.cleaning_speed = 0.5  # m²/min
         self.max_altitude = 50.0  # meters
         self.camera_fov = (60, 40)  # degrees
+        self._rng = np.random.default_rng()
+        self._path_cache: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+        self._window_centers = np.empty((0, 3), dtype=np.float32)
+        self._window_cleaned = np.zeros(0, dtype=bool)
 
     def takeoff(self) -> bool:
         if self.state != DroneState.IDLE:
@@ -44,7 +133,8 @@ class CleaningDrone:
         print("Taking off...")
         self.state = DroneState.SCANNING
         self.position = (0, 0, 5)  # Takeoff to 5m altitude
-        time.sleep(2)
+        if self.realtime:
+            time.sleep(2)
         return True
 
     def land(self) -> bool:
@@ -58,53 +148,66 @@ class CleaningDrone:
             print("Cannot scan - drone not in scanning mode")
             return False
         print(f"Scanning building for {scan_time} seconds...")
-        start_time = time.time()
-        while time.time() - start_time < scan_time:
-            if random.random() < 0.1:
-                self._detect_window()
-            self.battery -= 0.05
-            if self.battery < 15:
-                self._trigger_low_battery()
-                break
-            time.sleep(1)
+        # Battery drains 0.05% per one-second tick and the scan stops on the
+        # first tick that leaves it below 15%. Start from the closed form, then
+        # nudge it so the battery value actually stored makes that decision.
+        ticks = max(scan_time, 0)
+        if ticks > 0:
+            ticks_to_low = max(math.ceil((self.battery - 15) / 0.05), 1)
+            while self.battery - 0.05 * ticks_to_low >= 15:
+                ticks_to_low += 1
+            while ticks_to_low > 1 and self.battery - 0.05 * (ticks_to_low - 1) < 15:
+                ticks_to_low -= 1
+            ticks = min(ticks, ticks_to_low)
+        rng = self._rng
+        hits = np.nonzero(rng.random(ticks) < 0.1)[0]
+        self._detect_windows(hits.size)
+        self.battery -= 0.05 * ticks
+        low_battery = ticks > 0 and self.battery < 15
+        if self.realtime:
+            time.sleep(ticks - 1 if low_battery else ticks)
+        if low_battery:
+            self._trigger_low_battery()
         self.state = DroneState.MAPPING
         print("Scanning complete. Processing window data...")
         self._process_window_data()
         return True
 
-    def _detect_window(self) -> None:
-        window_id = len(self.windows) + 1
-        width = random.uniform(0.8, 2.5)
-        height = random.uniform(0.8, 1.8)
-        x = self.position[0] + random.uniform(-5, 5)
-        y = self.position[1] + random.uniform(2, 10)
-        z = self.position[2] + random.uniform(-2, 2)
-        corners = [
-            (x, y, z),
-            (x + width, y, z),
-            (x + width, y + height, z),
-            (x, y + height, z)
-        ]
-        center = (x + width / 2, y + height / 2, z)
-        self.windows.append(Window(
-            id=window_id,
-            corners=corners,
-            center=center,
-            size=(width, height)
-        ))
-        print(f"Detected window {window_id} at position {center}")
+    def _detect_windows(self, count: int) -> None:
+        rng = self._rng
+        widths = rng.uniform(0.8, 2.5, count)
+        heights = rng.uniform(0.8, 1.8, count)
+        offsets = rng.uniform([-5, 2, -2], [5, 10, 2], (count, 3))
+        x, y, z = (np.asarray(self.position, dtype=np.float64) + offsets).T
+        corners = np.stack([
+            np.stack([x, y, z], axis=1),
+            np.stack([x + widths, y, z], axis=1),
+            np.stack([x + widths, y + heights, z], axis=1),
+            np.stack([x, y + heights, z], axis=1)
+        ], axis=1)
+        centers = np.stack([x + widths / 2, y + heights / 2, z], axis=1)
+        first_id = len(self.windows) + 1
+        for i in range(count):
+            window_id = first_id + i
+            center = tuple(centers[i].tolist())
+            self.windows.append(Window(
+                id=window_id,
+                corners=[tuple(c) for c in corners[i].tolist()],
+                center=center,
+                size=(float(widths[i]), float(heights[i]))
+            ))
+            print(f"Detected window {window_id} at position {center}")
 
     def _process_window_data(self) -> None:
-        unique_windows = []
-        seen_positions = set()
-        for window in self.windows:
-            pos_key = (round(window.center[0], 1),
-                       round(window.center[1], 1),
-                       round(window.center[2], 1))
-            if pos_key not in seen_positions:
-                seen_positions.add(pos_key)
-                unique_windows.append(window)
-        self.windows = unique_windows
+        centers = np.array(
+            [w.center for w in self.windows], dtype=np.float64
+        ).reshape(-1, 3)
+        keys = np.round(centers, 1)
+        _, first_idx = np.unique(keys, axis=0, return_index=True)
+        keep = np.sort(first_idx)
+        self.windows = [self.windows[i] for i in keep]
+        self._window_centers = centers[keep].astype(np.float32)
+        self._window_cleaned = np.zeros(len(self.windows), dtype=bool)
         print(f"Identified {len(self.windows)} unique windows")
 
     def plan_cleaning_path(self, strategy: str = "zigzag") -> bool:
@@ -113,104 +216,138 @@ class CleaningDrone:
             return False
         self.state = DroneState.PATH_PLANNING
         print("Generating cleaning path...")
-        sorted_windows = sorted(self.windows, key=lambda w: w.center[1])
-        for window in sorted_windows:
-            approach_distance = 0.5
-            approach_point = (
-                window.center[0],
-                window.center[1],
-                window.center[2] - approach_distance
-            )
-            self.cleaning_path.append(approach_point)
-            cleaning_points = self._generate_cleaning_pattern(
-                window.corners, spacing=0.3
-            )
-            self.cleaning_path.extend(cleaning_points)
-        if self.cleaning_path:
-            self.cleaning_path.append(self.cleaning_path[0])
+        # windows is public and may have been filled without
+        # _process_window_data, so plan from it rather than the cached centers
+        self._window_centers = np.array(
+            [w.center for w in self.windows], dtype=np.float32
+        ).reshape(-1, 3)
+        # Per-run mask; Window.cleaned keeps the history across runs
+        self._window_cleaned = np.zeros(len(self.windows), dtype=bool)
+        # Key on center and corners, in list order: the zigzag depends on each
+        # window's extent, and duplicates or y-ties reorder the visit sequence
+        corners = np.array([w.corners for w in self.windows], dtype=np.float64)
+        geometry = np.hstack([self._window_centers, corners.reshape(len(self.windows), -1)])
+        key = tuple(map(tuple, np.round(geometry, 1).tolist()))
+        cached = self._path_cache.get(key)
+        if cached is not None:
+            self._path_cache.move_to_end(key)
+            self.cleaning_path = cached.copy()
+            print(f"Reusing cached path with {len(self.cleaning_path)} waypoints")
+            return True
+        order = np.argsort(self._window_centers[:, 1], kind="stable")
+        centers_sorted = self._window_centers[order]
+        windows_sorted = [self.windows[i] for i in order]
+        approach_distance = 0.5
+        approach_points = centers_sorted - np.array([0.0, 0.0, approach_distance], dtype=np.float32)
+        patterns = [window.pattern(spacing=0.3) for window in windows_sorted]
+        # One approach point and one zigzag block per window, then the closing
+        # return to the first approach point
+        total = sum(len(p) for p in patterns) + len(patterns) + 1
+        path = np.empty((total, 3), dtype=np.float32)
+        k = 0
+        for i, pattern in enumerate(patterns):
+            path[k] = approach_points[i]
+            path[k + 1:k + 1 + len(pattern)] = pattern
+            k += 1 + len(pattern)
+        path[k] = path[0]
+        self.cleaning_path = path
+        self._path_cache[key] = self.cleaning_path.copy()
+        if len(self._path_cache) > PATH_CACHE_SIZE:
+            self._path_cache.popitem(last=False)
         print(f"Generated path with {len(self.cleaning_path)} waypoints")
         return True
 
-    def _generate_cleaning_pattern(self, corners: List[Tuple], spacing: float) -> List[Tuple]:
-        points = []
-        min_x = min(c[0] for c in corners)
-        max_x = max(c[0] for c in corners)
-        min_y = min(c[1] for c in corners)
-        max_y = max(c[1] for c in corners)
-        z_pos = corners[0][2]
-        current_y = min_y
-        while current_y <= max_y:
-            points.append((min_x, current_y, z_pos))
-            points.append((max_x, current_y, z_pos))
-            current_y += spacing
-        return points
-
     def execute_cleaning(self) -> bool:
-        if not self.cleaning_path:
+        if len(self.cleaning_path) == 0:
             print("No cleaning path - plan path first")
             return False
         self.state = DroneState.CLEANING
         print("Starting cleaning sequence...")
-        for i, point in enumerate(self.cleaning_path):
-            if self.battery < 10:
+        # Locals avoid attribute lookups in the per-waypoint loop; battery and
+        # fluid are written back to self on every exit path
+        path = self.cleaning_path
+        n = len(path)
+        safe_move = self._safe_move
+        activate = self._activate_cleaning
+        battery = self.battery
+        fluid = self.cleaning_fluid
+        # The sprayer is idle on the first two waypoints of every ten
+        active = ((np.arange(n) % 10) > 1).tolist()
+        visited = 0
+        for i in range(n):
+            if battery < 10:
                 print("Critical battery level! Aborting cleaning.")
+                self.battery, self.cleaning_fluid = battery, fluid
+                self._mark_cleaned_windows(path[:visited])
                 self._trigger_emergency()
                 return False
-            if self.cleaning_fluid < 5:
+            if fluid < 5:
                 print("Out of cleaning fluid! Aborting cleaning.")
                 self.state = DroneState.RETURNING
                 break
-            if not self._safe_move(point):
+            if not safe_move(path[i]):
                 print("Movement failed! Aborting cleaning.")
+                self.battery, self.cleaning_fluid = battery, fluid
+                self._mark_cleaned_windows(path[:visited])
                 self._trigger_emergency()
                 return False
-            if i % 10 > 1:
-                self._activate_cleaning()
-            self.battery -= 0.1
-            self.cleaning_fluid -= 0.2
-            for window in self.windows:
-                dist = math.sqrt(
-                    (window.center[0] - point[0])**2 +
-                    (window.center[1] - point[1])**2 +
-                    (window.center[2] - point[2])**2
-                )
-                if dist < 1.0:
-                    window.cleaned = True
+            if active[i]:
+                activate()
+            battery -= 0.1
+            fluid -= 0.2
+            visited = i + 1
+        self.battery, self.cleaning_fluid = battery, fluid
+        self._mark_cleaned_windows(path[:visited])
         print("Cleaning sequence complete")
         self.state = DroneState.RETURNING
         self.return_to_home()
         return True
 
-    def _safe_move(self, target: Tuple) -> bool:
-        distance = math.sqrt(
-            (target[0] - self.position[0])**2 +
-            (target[1] - self.position[1])**2 +
-            (target[2] - self.position[2])**2
-        )
-        if distance > 10:
+    def _mark_cleaned_windows(self, path) -> None:
+        path = np.asarray(path, dtype=np.float32).reshape(-1, 3)
+        _mark_cleaned(path, self._window_centers, self._window_cleaned)
+        for window, cleaned in zip(self.windows, self._window_cleaned):
+            window.cleaned = window.cleaned or bool(cleaned)
+
+    def _safe_move(self, target: Union[Tuple, np.ndarray]) -> bool:
+        if isinstance(target, np.ndarray):
+            target = target.tolist()
+        tx, ty, tz = target
+        px, py, pz = self.position
+        dx, dy, dz = tx - px, ty - py, tz - pz
+        d2 = dx * dx + dy * dy + dz * dz
+        segmented = d2 > 100.0
+        if segmented:
             print("Movement distance too large - breaking into segments")
-            steps = int(distance // 5) + 1
-            for i in range(steps):
-                intermediate = (
-                    self.position[0] + (target[0] - self.position[0]) * (i + 1) / steps,
-                    self.position[1] + (target[1] - self.position[1]) * (i + 1) / steps,
-                    self.position[2] + (target[2] - self.position[2]) * (i + 1) / steps
-                )
-                if not self._safe_move(intermediate):
-                    return False
-            return True
-        if target[1] > self.max_altitude:
+        elif ty > self.max_altitude:
             print(f"Cannot exceed max altitude of {self.max_altitude}m")
             return False
-        move_time = distance / self.speed
-        print(f"Moving to {target} (distance: {distance:.2f}m, time: {move_time:.1f}s)")
-        time.sleep(min(move_time, 0.1))
-        self.position = target
+        distance = math.sqrt(d2)
+        if segmented:
+            steps = int(distance // 5) + 1
+            points = _interp_path(np.array([px, py, pz], dtype=np.float64),
+                                  np.array([dx, dy, dz], dtype=np.float64), steps)
+            if points[:, 1].max() > self.max_altitude:
+                print(f"Cannot exceed max altitude of {self.max_altitude}m")
+                return False
+            points = [tuple(p) for p in points.tolist()]
+        else:
+            steps = 1
+            points = [(float(tx), float(ty), float(tz))]
+        segment = distance / steps
+        move_time = segment / self.speed
+        realtime = self.realtime
+        for position in points:
+            print(f"Moving to {position} (distance: {segment:.2f}m, time: {move_time:.1f}s)")
+            if realtime:
+                time.sleep(min(move_time, 0.1))
+        self.position = position
         return True
 
     def _activate_cleaning(self) -> None:
         print("Activating cleaning system - spraying fluid and wiping")
-        time.sleep(0.5)
+        if self.realtime:
+            time.sleep(0.5)
 
     def _trigger_low_battery(self) -> None:
         print("Warning: Low battery!")
@@ -233,13 +370,15 @@ class CleaningDrone:
 
     def recharge(self) -> None:
         print("Recharging battery...")
-        time.sleep(2)
+        if self.realtime:
+            time.sleep(2)
         self.battery = 100.0
         print("Battery fully charged")
 
     def refill_fluid(self) -> None:
         print("Refilling cleaning fluid...")
-        time.sleep(1.5)
+        if self.realtime:
+            time.sleep(1.5)
         self.cleaning_fluid = 100.0
         print("Cleaning fluid refilled")
 